@@ -1,28 +1,85 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Flask, render_template, stream_template, request, redirect, url_for, session, flash
+from flask_session import Session
 from werkzeug.security import generate_password_hash, check_password_hash
+import os
 import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from uuid import uuid4
-from ml_model import recommend, train_and_save
+import numpy as np
+from ml_model import recommend, train_and_save, load_model
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional: compute_stats falls back to a dict loop
+    njit = None
 
 
 app = Flask(__name__)
 app.secret_key = "supersecretkey"  # replace in production
 
+# Server-side sessions (the cookie only carries a session id)
+app.config["SESSION_TYPE"] = "filesystem"
+Session(app)
+
+# PBKDF2 work factor for new password hashes (lower it only for dev/test)
+PBKDF2_ITER = int(os.environ.get("PBKDF2_ITERATIONS", 600000))
+
 # -----------------------------
 # In-Memory Storage (LOCAL ONLY)
 # -----------------------------
 users = {}  # {username: hashed_password}
 
-# customers: {customer_id: {"name": str, "created_at": str}}
+# customers: {customer_id: {"name": str, "interest": str, "created_at": str}}
 customers = {}
 
-# campaigns: list of dicts
+# sorted [{"customer_id": ..., **data}] view of customers, rebuilt lazily
+# after add/delete (see sorted_customers)
+_customer_items = None
+
+# campaigns: deque of dicts, newest first (launch uses appendleft)
 # {
 #   "id": str, "customer_id": str, "product": str, "status": str,
 #   "created_at": str, "open_rate": int, "click_rate": int, "conversions": int
 # }
-campaigns = []
+campaigns = deque()
+
+# campaign indexes, kept in sync with `campaigns` on launch/delete
+# campaigns_by_id: {campaign_id: campaign}
+# campaigns_by_customer: {customer_id: {campaign_id: campaign}} (insertion ordered)
+campaigns_by_id = {}
+campaigns_by_customer = {}
+
+# running stats, kept in sync the same way:
+# [total, sent, open_rate sum, click_rate sum, conversions]
+campaign_stats = [0, 0, 0, 0, 0]
+campaign_stats_by_customer = {}  # {customer_id: [...same...]}
+
+# campaign metrics as struct-of-arrays for compute_stats; each campaign
+# owns row c["_slot"], slots of deleted campaigns are reused
+_open_arr = np.zeros(1024, dtype=np.int32)
+_click_arr = np.zeros(1024, dtype=np.int32)
+_conv_arr = np.zeros(1024, dtype=np.int32)
+_sent_mask = np.zeros(1024, dtype=np.bool_)
+_free_slots = []
+_next_slot = 0
+
+# -----------------------------
+# Background Model Training
+# -----------------------------
+# Retrain after RETRAIN_EVERY new campaigns or RETRAIN_INTERVAL seconds,
+# on a single worker thread so launch_campaign never waits on training.
+# Only campaigns launched since the last run are fed to partial_fit.
+RETRAIN_EVERY = 10
+RETRAIN_INTERVAL = 300  # seconds
+
+train_executor = ThreadPoolExecutor(max_workers=1)
+pending_training = []  # campaigns not yet seen by the model
+_last_train_ts = 0.0
+_train_lock = threading.Lock()  # guards pending_training and _last_train_ts
 
 
 # -----------------------------
@@ -31,6 +88,18 @@ campaigns = []
 def now_str():
     return datetime.now().strftime("%Y-%m-%d %H:%M")
 
+def sorted_customers():
+    global _customer_items
+    if _customer_items is None:
+        items = [{"customer_id": cid, **data} for cid, data in customers.items()]
+        items.sort(key=lambda x: x["customer_id"].lower())
+        _customer_items = items
+    return _customer_items
+
+def invalidate_customers():
+    global _customer_items
+    _customer_items = None
+
 def require_login():
     if "username" not in session:
         flash("Please login first.")
@@ -41,20 +110,131 @@ def recommend_product():
     products = ["Wireless Headphones", "Smartwatch", "Laptop", "Bluetooth Speaker"]
     return random.choice(products)
 
+_rng = np.random.default_rng()
+
 def fake_metrics():
-    open_rate = random.randint(10, 90)
-    click_rate = random.randint(1, max(1, open_rate))
-    conversions = random.randint(0, 10)
+    open_rate = int(_rng.integers(10, 91))
+    click_rate = int(_rng.integers(1, open_rate + 1))
+    conversions = int(_rng.integers(0, 11))
     return open_rate, click_rate, conversions
 
-def compute_stats(campaign_list):
-    total = len(campaign_list)
-    sent = sum(1 for c in campaign_list if c.get("status") == "Sent")
-    avg_open = round(sum(c.get("open_rate", 0) for c in campaign_list) / total, 1) if total else 0
-    avg_click = round(sum(c.get("click_rate", 0) for c in campaign_list) / total, 1) if total else 0
-    total_conv = sum(c.get("conversions", 0) for c in campaign_list)
+def _training_done(future):
+    global _last_train_ts
+    if future.exception() is not None:
+        print(f"⚠️ ML training failed: {future.exception()}")
+    elif future.result():
+        print("✅ ML model trained and saved")
+    elif load_model() is None:
+        print("⚠️ Not enough data to train ML model yet")
+        with _train_lock:
+            _last_train_ts = 0.0  # bootstrap lacked data: retry on the next launch
+
+def maybe_train(item):
+    """Queue a new campaign for training and start a run if one is due."""
+    global pending_training, _last_train_ts
+    with _train_lock:
+        pending_training.append(item)
+        now = time.time()
+        if len(pending_training) < RETRAIN_EVERY and now - _last_train_ts <= RETRAIN_INTERVAL:
+            return
+        new_campaigns, pending_training = pending_training, []
+        _last_train_ts = now
+    # shallow copies so request threads can keep mutating the originals
+    future = train_executor.submit(train_and_save, dict(customers), list(campaigns), new_campaigns)
+    future.add_done_callback(_training_done)
+
+def index_campaign(c):
+    # lowercased search text, built once instead of on every analytics search
+    c["_search"] = "\0".join(
+        (c["customer_id"], c["product"], c["status"], c.get("created_at", ""))
+    ).lower()
+    store_metrics(c)
+    campaigns_by_id[c["id"]] = c
+    campaigns_by_customer.setdefault(c["customer_id"], {})[c["id"]] = c
+    update_stats(campaign_stats, c, 1)
+    update_stats(campaign_stats_by_customer.setdefault(c["customer_id"], [0, 0, 0, 0, 0]), c, 1)
+
+def unindex_campaign(c):
+    if campaigns_by_id.pop(c["id"], None) is None:
+        return
+    by_customer = campaigns_by_customer.get(c["customer_id"])
+    if by_customer is not None:
+        by_customer.pop(c["id"], None)
+        if not by_customer:
+            del campaigns_by_customer[c["customer_id"]]
+    update_stats(campaign_stats, c, -1)
+    customer_stats = campaign_stats_by_customer[c["customer_id"]]
+    update_stats(customer_stats, c, -1)
+    if not customer_stats[0]:
+        del campaign_stats_by_customer[c["customer_id"]]
+    _free_slots.append(c["_slot"])
+
+def store_metrics(c):
+    global _open_arr, _click_arr, _conv_arr, _sent_mask, _next_slot
+    if _free_slots:
+        slot = _free_slots.pop()
+    else:
+        slot = _next_slot
+        _next_slot += 1
+        if slot == len(_open_arr):
+            # grow by doubling; old rows are copied, new rows start at zero
+            _open_arr = np.concatenate((_open_arr, np.zeros_like(_open_arr)))
+            _click_arr = np.concatenate((_click_arr, np.zeros_like(_click_arr)))
+            _conv_arr = np.concatenate((_conv_arr, np.zeros_like(_conv_arr)))
+            _sent_mask = np.concatenate((_sent_mask, np.zeros_like(_sent_mask)))
+    _open_arr[slot] = c.get("open_rate", 0)
+    _click_arr[slot] = c.get("click_rate", 0)
+    _conv_arr[slot] = c.get("conversions", 0)
+    _sent_mask[slot] = c.get("status") == "Sent"
+    c["_slot"] = slot
+
+def update_stats(stats, c, sign):
+    stats[0] += sign
+    if c.get("status") == "Sent":
+        stats[1] += sign
+    stats[2] += sign * c.get("open_rate", 0)
+    stats[3] += sign * c.get("click_rate", 0)
+    stats[4] += sign * c.get("conversions", 0)
+
+def summarize_stats(total, sent, open_sum, click_sum, total_conv):
+    avg_open = round(open_sum / total, 1) if total else 0
+    avg_click = round(click_sum / total, 1) if total else 0
     return total, sent, avg_open, avg_click, total_conv
 
+def _aggregate(open_arr, click_arr, conv_arr, sent_mask, idx):
+    sent = open_sum = click_sum = total_conv = 0
+    for i in idx:
+        if sent_mask[i]:
+            sent += 1
+        open_sum += open_arr[i]
+        click_sum += click_arr[i]
+        total_conv += conv_arr[i]
+    return len(idx), sent, open_sum, click_sum, total_conv
+
+if njit is not None:
+    # cache=True reuses the compiled code across restarts; the warm-up call
+    # keeps the first compile (or cache load) out of the first request
+    _aggregate = njit(cache=True)(_aggregate)
+    _aggregate(_open_arr, _click_arr, _conv_arr, _sent_mask, np.empty(0, dtype=np.int64))
+
+def compute_stats(campaign_list):
+    if njit is None:
+        # single pass over the dicts; faster than looping over NumPy scalars
+        total = sent = open_sum = click_sum = total_conv = 0
+        for c in campaign_list:
+            total += 1
+            if c.get("status") == "Sent":
+                sent += 1
+            open_sum += c.get("open_rate", 0)
+            click_sum += c.get("click_rate", 0)
+            total_conv += c.get("conversions", 0)
+        return summarize_stats(total, sent, open_sum, click_sum, total_conv)
+
+    # gather slots first: arrays read afterwards already hold every row
+    idx = np.fromiter((c["_slot"] for c in campaign_list), dtype=np.int64)
+    totals = _aggregate(_open_arr, _click_arr, _conv_arr, _sent_mask, idx)
+    return summarize_stats(*(int(x) for x in totals))
+
 
 # -----------------------------
 # Auth Routes
@@ -77,7 +257,7 @@ def signup():
             flash("Username already exists!")
             return redirect(url_for("signup"))
 
-        users[username] = generate_password_hash(password, method="pbkdf2:sha256")
+        users[username] = generate_password_hash(password, method=f"pbkdf2:sha256:{PBKDF2_ITER}")
         flash("Account created successfully! Please login.")
         return redirect(url_for("login"))
 
@@ -119,7 +299,6 @@ def customers_page():
         customer_id = request.form.get("customer_id", "").strip()
         name = request.form.get("name", "").strip()
         interest = request.form.get("interest", "").strip()
-        customers[customer_id] = {"name": name or "Unknown", "interest": interest, "created_at": now_str()}
 
         if not customer_id:
             flash("Customer ID is required.")
@@ -129,17 +308,15 @@ def customers_page():
             flash("Customer already exists.")
             return redirect(url_for("customers_page"))
 
-        customers[customer_id] = {"name": name or "Unknown", "created_at": now_str()}
+        customers[customer_id] = {"name": name or "Unknown", "interest": interest, "created_at": now_str()}
+        invalidate_customers()
         flash("Customer added successfully!")
         return redirect(url_for("customers_page"))
 
-    customer_items = [{"customer_id": cid, **data} for cid, data in customers.items()]
-    customer_items.sort(key=lambda x: x["customer_id"].lower())
-
     return render_template(
         "customers.html",
         username=session["username"],
-        customers=customer_items,
+        customers=sorted_customers(),
         campaign_count=len(campaigns)
     )
 
@@ -151,10 +328,13 @@ def delete_customer(customer_id):
     # delete customer
     if customer_id in customers:
         del customers[customer_id]
+        invalidate_customers()
 
     # delete all campaigns for that customer
     global campaigns
-    campaigns = [c for c in campaigns if c["customer_id"] != customer_id]
+    for c in list(campaigns_by_customer.get(customer_id, {}).values()):
+        unindex_campaign(c)
+    campaigns = deque(c for c in campaigns if c["customer_id"] != customer_id)
 
     flash(f"Deleted customer {customer_id} and related campaigns.")
     return redirect(url_for("customers_page"))
@@ -168,16 +348,11 @@ def dashboard():
     if not require_login():
         return redirect(url_for("login"))
 
-    customer_items = [{"customer_id": cid, **data} for cid, data in customers.items()]
-    customer_items.sort(key=lambda x: x["customer_id"].lower())
-
-    recent_campaigns = list(reversed(campaigns))
-
     return render_template(
         "dashboard.html",
         username=session["username"],
-        customers=customer_items,
-        campaigns=recent_campaigns
+        customers=sorted_customers(),
+        campaigns=list(campaigns)  # snapshot: launches may appendleft mid-render
     )
 
 @app.route('/launch_campaign', methods=['POST'])
@@ -195,7 +370,9 @@ def launch_campaign():
 
     # --- AI Recommendation ---
     if product == "AI Recommended":
-        predicted = recommend(customers, campaigns, customer_id)
+        # per-customer history, oldest first (recommend uses the last one)
+        history = list(campaigns_by_customer.get(customer_id, {}).values())
+        predicted = recommend(customers, history, customer_id)
         print(f"🤖 ML predicted product for {customer_id}: {predicted}")
         product = predicted
 
@@ -203,7 +380,7 @@ def launch_campaign():
     open_rate, click_rate, conversions = fake_metrics()
 
     # --- Save campaign ---
-    campaigns.append({
+    item = {
         "id": str(uuid4()),
         "customer_id": customer_id,
         "product": product,
@@ -212,14 +389,12 @@ def launch_campaign():
         "open_rate": open_rate,
         "click_rate": click_rate,
         "conversions": conversions
-    })
+    }
+    index_campaign(item)  # before publishing, so readers never see it unindexed
+    campaigns.appendleft(item)
 
-    # --- TRAIN MODEL HERE ---
-    result = train_and_save(customers, campaigns)
-    if result:
-        print("✅ ML model trained and saved")
-    else:
-        print("⚠️ Not enough data to train ML model yet")
+    # --- TRAIN MODEL (debounced, in the background) ---
+    maybe_train(item)
 
     flash(f"Campaign launched for {customer_id}")
     return redirect(url_for('dashboard'))
@@ -231,11 +406,11 @@ def delete_campaign(campaign_id):
         return redirect(url_for("login"))
 
     global campaigns
-    before = len(campaigns)
-    campaigns = [c for c in campaigns if c["id"] != campaign_id]
-    after = len(campaigns)
+    victim = campaigns_by_id.get(campaign_id)
 
-    if after < before:
+    if victim is not None:
+        unindex_campaign(victim)
+        campaigns = deque(c for c in campaigns if c["id"] != campaign_id)
         flash("Campaign deleted.")
     else:
         flash("Campaign not found.")
@@ -259,41 +434,36 @@ def analytics():
     if not require_login():
         return redirect(url_for("login"))
 
-    # dropdown of customers
-    customer_items = [{"customer_id": cid, **data} for cid, data in customers.items()]
-    customer_items.sort(key=lambda x: x["customer_id"].lower())
-
     # filters from query params
     customer_filter = request.args.get("customer", "").strip()
     q = request.args.get("q", "").strip().lower()
 
-    filtered = campaigns[:]
-
-    # filter by customer
+    # filter by customer (index lookup instead of a full scan), newest first
     if customer_filter:
-        filtered = [c for c in filtered if c["customer_id"] == customer_filter]
+        filtered = list(reversed(campaigns_by_customer.get(customer_filter, {}).values()))
+    else:
+        # snapshot: rows are rendered after this view returns
+        filtered = list(campaigns)
 
-    # search across customer_id/product/status
+    # search across customer_id/product/status/created_at
     if q:
-        def match(c):
-            return (
-                q in c["customer_id"].lower()
-                or q in c["product"].lower()
-                or q in c["status"].lower()
-                or q in c.get("created_at", "").lower()
-            )
-        filtered = [c for c in filtered if match(c)]
-
-    # newest first
-    filtered_recent = list(reversed(filtered))
+        filtered = [c for c in filtered if q in c["_search"]]
 
-    total, sent, avg_open, avg_click, total_conv = compute_stats(filtered)
+    # without a search, stats come from the running totals
+    if q:
+        stats = compute_stats(filtered)
+    elif customer_filter:
+        stats = summarize_stats(*campaign_stats_by_customer.get(customer_filter, [0, 0, 0, 0, 0]))
+    else:
+        stats = summarize_stats(*campaign_stats)
+    total, sent, avg_open, avg_click, total_conv = stats
 
-    return render_template(
+    # stream the page so the rendered HTML is never held in memory as a whole
+    return app.response_class(stream_template(
         "analytics.html",
         username=session["username"],
-        customers=customer_items,
-        campaigns=filtered_recent,
+        customers=sorted_customers(),
+        campaigns=filtered,
         total_campaigns=total,
         sent_campaigns=sent,
         avg_open=avg_open,
@@ -301,7 +471,7 @@ def analytics():
         total_conversions=total_conv,
         customer_filter=customer_filter,
         q=q
-    )
+    ), mimetype="text/html")
 
 
 if __name__ == "__main__":
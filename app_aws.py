@@ -3,14 +3,19 @@
 # Uses DynamoDB for Users/Customers/Campaigns and SNS for notifications.
 # Keeps your current logic (customer_id stays as-is).
 
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Flask, render_template, stream_template, request, redirect, url_for, session, flash, g, has_request_context
+from flask_session import Session
 from werkzeug.security import generate_password_hash, check_password_hash
 import os
+import threading
+import time
 import boto3
+from boto3.dynamodb.conditions import Attr, Key
 from botocore.exceptions import ClientError
 from uuid import uuid4
 from datetime import datetime
-import random
+import numpy as np
+from sortedcontainers import SortedDict
 
 # OPTIONAL (if you already have these files and want ML on AWS too):
 # from ml_model import recommend, train_and_save
@@ -18,6 +23,18 @@ import random
 app = Flask(__name__)
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", "dev_secret_key_change_me")
 
+# Sessions default to Flask's signed cookie, which works across instances
+# behind a load balancer. Set SESSION_TYPE to opt into server-side sessions
+# (the cookie then only carries an id): "redis" (+ REDIS_URL) shares them
+# between instances, "filesystem" is only safe on a single instance.
+SESSION_TYPE = os.environ.get("SESSION_TYPE", "")
+if SESSION_TYPE:
+    app.config["SESSION_TYPE"] = SESSION_TYPE
+    if SESSION_TYPE == "redis":
+        import redis
+        app.config["SESSION_REDIS"] = redis.from_url(os.environ.get("REDIS_URL", "redis://localhost:6379"))
+    Session(app)
+
 # -----------------------------
 # AWS Configuration
 # -----------------------------
@@ -27,8 +44,18 @@ USERS_TABLE_NAME = os.environ.get("USERS_TABLE", "MarketingUsers")
 CUSTOMERS_TABLE_NAME = os.environ.get("CUSTOMERS_TABLE", "MarketingCustomers")
 CAMPAIGNS_TABLE_NAME = os.environ.get("CAMPAIGNS_TABLE", "MarketingCampaigns")
 
+# Campaigns GSIs (both sorted by created_at):
+#   CustomerIndex -> HASH customer_id  (per-customer listing / delete)
+#   AllIndex      -> HASH gsi_pk="ALL" (newest-first listing of every campaign)
+CAMPAIGNS_CUSTOMER_INDEX = os.environ.get("CAMPAIGNS_CUSTOMER_INDEX", "CustomerIndex")
+CAMPAIGNS_ALL_INDEX = os.environ.get("CAMPAIGNS_ALL_INDEX", "AllIndex")
+CAMPAIGNS_ALL_PK = "ALL"
+
 SNS_TOPIC_ARN = os.environ.get("SNS_TOPIC_ARN", "")  # optional (leave empty to disable)
 
+# PBKDF2 work factor for new password hashes (lower it only for dev/test)
+PBKDF2_ITER = int(os.environ.get("PBKDF2_ITERATIONS", 600000))
+
 dynamodb = boto3.resource("dynamodb", region_name=REGION)
 sns = boto3.client("sns", region_name=REGION)
 
@@ -36,6 +63,25 @@ users_table = dynamodb.Table(USERS_TABLE_NAME)
 customers_table = dynamodb.Table(CUSTOMERS_TABLE_NAME)
 campaigns_table = dynamodb.Table(CAMPAIGNS_TABLE_NAME)
 
+# -----------------------------
+# List Caches
+# -----------------------------
+# Table snapshots reused between writes (per process, short TTL so other
+# workers' writes show up quickly). Writes invalidate them immediately.
+LIST_CACHE_TTL = float(os.environ.get("LIST_CACHE_TTL", 5))
+
+_campaigns_cache = {"data": None, "ts": 0}
+
+# Customers are mirrored in memory, ordered by lowercase customer_id.
+# Loaded by one paginated scan on first use, kept in sync by this process'
+# writes, and re-synced every CUSTOMERS_RESYNC_SECONDS to pick up writes
+# from other instances.
+CUSTOMERS_RESYNC_SECONDS = float(os.environ.get("CUSTOMERS_RESYNC_SECONDS", 60))
+
+_customers_local = SortedDict(str.lower)  # {customer_id: item}
+_customers_local_ts = None
+_customers_lock = threading.Lock()
+
 
 # -----------------------------
 # Helpers
@@ -51,6 +97,27 @@ def require_login():
     return True
 
 
+def cached_list(cache: dict, name: str, loader):
+    """Return loader() via the per-request (flask.g) and TTL caches."""
+    if has_request_context() and name in g:
+        return g.get(name)
+
+    now = time.monotonic()
+    if cache["data"] is None or now - cache["ts"] >= LIST_CACHE_TTL:
+        cache["data"] = loader()
+        cache["ts"] = now
+
+    if has_request_context():
+        setattr(g, name, cache["data"])
+    return cache["data"]
+
+
+def invalidate_list(cache: dict, name: str):
+    cache["data"] = None
+    if has_request_context():
+        g.pop(name, None)
+
+
 def send_notification(subject: str, message: str):
     """Publish to SNS topic (optional)."""
     if not SNS_TOPIC_ARN:
@@ -61,20 +128,29 @@ def send_notification(subject: str, message: str):
         print(f"SNS publish error: {e}")
 
 
+_rng = np.random.default_rng()
+
+
 def fake_metrics():
     """Temporary engagement metrics (until you wire real tracking)."""
-    open_rate = random.randint(10, 90)
-    click_rate = random.randint(1, max(1, open_rate))
-    conversions = random.randint(0, 10)
-    return int(open_rate), int(click_rate), int(conversions)
+    open_rate = int(_rng.integers(10, 91))
+    click_rate = int(_rng.integers(1, open_rate + 1))
+    conversions = int(_rng.integers(0, 11))
+    return open_rate, click_rate, conversions
 
 
 def compute_stats(campaign_list):
-    total = len(campaign_list)
-    sent = sum(1 for c in campaign_list if c.get("status") == "Sent")
-    avg_open = round(sum(int(c.get("open_rate", 0)) for c in campaign_list) / total, 1) if total else 0
-    avg_click = round(sum(int(c.get("click_rate", 0)) for c in campaign_list) / total, 1) if total else 0
-    total_conv = sum(int(c.get("conversions", 0)) for c in campaign_list)
+    # single pass over the list for all aggregates
+    total = sent = open_sum = click_sum = total_conv = 0
+    for c in campaign_list:
+        total += 1
+        if c.get("status") == "Sent":
+            sent += 1
+        open_sum += c.get("open_rate", 0)
+        click_sum += c.get("click_rate", 0)
+        total_conv += c.get("conversions", 0)
+    avg_open = round(open_sum / total, 1) if total else 0
+    avg_click = round(click_sum / total, 1) if total else 0
     return total, sent, avg_open, avg_click, total_conv
 
 
@@ -91,56 +167,198 @@ def db_create_user(username: str, password_hash: str):
 
 
 def db_list_customers():
-    res = customers_table.scan()
-    items = res.get("Items", [])
-    items.sort(key=lambda x: x.get("customer_id", "").lower())
-    return items
-
-
-def db_customer_exists(customer_id: str) -> bool:
-    res = customers_table.get_item(Key={"customer_id": customer_id})
-    return "Item" in res
-
-
-def db_add_customer(customer_id: str, name: str, interest: str):
-    customers_table.put_item(Item={
+    """Customers sorted by customer_id, served from the in-memory mirror."""
+    global _customers_local_ts
+    with _customers_lock:
+        now = time.monotonic()
+        if _customers_local_ts is None or now - _customers_local_ts >= CUSTOMERS_RESYNC_SECONDS:
+            _customers_local.clear()
+            _customers_local.update((c["customer_id"], c) for c in db_scan_all(customers_table))
+            _customers_local_ts = now
+        return list(_customers_local.values())
+
+
+def db_scan_all(table, **kwargs):
+    """Run a Scan and follow LastEvaluatedKey until every page is read."""
+    items = []
+    while True:
+        res = table.scan(**kwargs)
+        items.extend(res.get("Items", []))
+        if "LastEvaluatedKey" not in res:
+            return items
+        kwargs["ExclusiveStartKey"] = res["LastEvaluatedKey"]
+
+
+def is_condition_failure(e: ClientError) -> bool:
+    return e.response["Error"]["Code"] == "ConditionalCheckFailedException"
+
+
+def db_add_customer(customer_id: str, name: str, interest: str) -> bool:
+    """Insert a customer; False if the id already exists (single conditional put)."""
+    item = {
         "customer_id": customer_id,
         "name": name or "Unknown",
         "interest": interest or "unknown",
         "created_at": now_str()
-    })
+    }
+    try:
+        customers_table.put_item(Item=item, ConditionExpression="attribute_not_exists(customer_id)")
+    except ClientError as e:
+        if is_condition_failure(e):
+            return False
+        raise
+    with _customers_lock:
+        _customers_local[customer_id] = item
+    return True
+
+
+def db_delete_customer(customer_id: str) -> bool:
+    """Delete a customer; False if it did not exist (single conditional delete)."""
+    try:
+        customers_table.delete_item(
+            Key={"customer_id": customer_id},
+            ConditionExpression="attribute_exists(customer_id)",
+        )
+    except ClientError as e:
+        if is_condition_failure(e):
+            return False
+        raise
+    with _customers_lock:
+        _customers_local.pop(customer_id, None)
+    return True
 
 
-def db_delete_customer(customer_id: str):
-    customers_table.delete_item(Key={"customer_id": customer_id})
+# numeric campaign attributes; DynamoDB hands them back as Decimal
+CAMPAIGN_METRICS = ("open_rate", "click_rate", "conversions")
 
 
-def db_list_campaigns():
-    res = campaigns_table.scan()
-    items = res.get("Items", [])
-    # newest first
-    items.sort(key=lambda x: x.get("created_at", ""), reverse=True)
+def db_campaigns_from_items(items):
+    """
+    Prepare campaigns once, at read time: Decimal metrics -> int and a
+    lowercased search string for analytics (never written back).
+    Nothing downstream (stats, templates) converts again.
+    """
+    for c in items:
+        for k in CAMPAIGN_METRICS:
+            c[k] = int(c.get(k, 0))
+        c["_search"] = "\0".join((
+            str(c.get("customer_id", "")),
+            str(c.get("product", "")),
+            str(c.get("status", "")),
+            str(c.get("created_at", "")),
+        )).lower()
     return items
 
 
-def db_add_campaign(item: dict):
-    campaigns_table.put_item(Item=item)
+def db_query_all(table, **kwargs):
+    """Run a Query and follow LastEvaluatedKey until every page is read."""
+    items = []
+    while True:
+        res = table.query(**kwargs)
+        items.extend(res.get("Items", []))
+        if "LastEvaluatedKey" not in res:
+            return items
+        kwargs["ExclusiveStartKey"] = res["LastEvaluatedKey"]
+
+
+def db_list_campaigns(customer_id: str = ""):
+    """Newest-first campaigns, served pre-sorted by a created_at GSI."""
+    if customer_id:
+        return db_campaigns_from_items(db_query_all(
+            campaigns_table,
+            IndexName=CAMPAIGNS_CUSTOMER_INDEX,
+            KeyConditionExpression=Key("customer_id").eq(customer_id),
+            ScanIndexForward=False,
+        ))
+    return cached_list(_campaigns_cache, "campaigns", db_query_all_campaigns)
+
+
+def db_query_all_campaigns():
+    return db_campaigns_from_items(db_query_all(
+        campaigns_table,
+        IndexName=CAMPAIGNS_ALL_INDEX,
+        KeyConditionExpression=Key("gsi_pk").eq(CAMPAIGNS_ALL_PK),
+        ScanIndexForward=False,
+    ))
+
+
+def db_add_campaign(item: dict) -> bool:
+    """
+    Insert a campaign only if its customer exists. The existence check and
+    the put go out as one transaction; False if the customer is missing.
+    """
+    # the resource's client (de)serializes plain Python values like Table does
+    try:
+        dynamodb.meta.client.transact_write_items(TransactItems=[
+            {"ConditionCheck": {
+                "TableName": CUSTOMERS_TABLE_NAME,
+                "Key": {"customer_id": item["customer_id"]},
+                "ConditionExpression": "attribute_exists(customer_id)",
+            }},
+            {"Put": {
+                "TableName": CAMPAIGNS_TABLE_NAME,
+                "Item": {**item, "gsi_pk": CAMPAIGNS_ALL_PK},
+            }},
+        ])
+    except ClientError as e:
+        reasons = e.response.get("CancellationReasons", [])
+        if reasons and reasons[0].get("Code") == "ConditionalCheckFailed":
+            return False
+        raise
+    invalidate_list(_campaigns_cache, "campaigns")
+    return True
 
 
 def db_delete_campaign(campaign_id: str):
     campaigns_table.delete_item(Key={"campaign_id": campaign_id})
+    invalidate_list(_campaigns_cache, "campaigns")
 
 
 def db_delete_campaigns_for_customer(customer_id: str):
     """
-    For small projects, scan+delete is OK.
-    For production, add a GSI on customer_id and query instead.
+    Query the CustomerIndex GSI for just the keys, then delete them in
+    batches of up to 25 (batch_writer also retries unprocessed items).
     """
-    res = campaigns_table.scan()
-    items = res.get("Items", [])
+    items = db_query_all(
+        campaigns_table,
+        IndexName=CAMPAIGNS_CUSTOMER_INDEX,
+        KeyConditionExpression=Key("customer_id").eq(customer_id),
+        ProjectionExpression="campaign_id",
+    )
+    with campaigns_table.batch_writer() as batch:
+        for c in items:
+            batch.delete_item(Key={"campaign_id": c["campaign_id"]})
+    invalidate_list(_campaigns_cache, "campaigns")
+
+
+def db_backfill_campaigns_gsi_pk() -> int:
+    """
+    One-time migration: give campaigns written before AllIndex existed the
+    gsi_pk attribute, so they show up in db_list_campaigns(). Returns the
+    number of items updated.
+    """
+    items = db_scan_all(
+        campaigns_table,
+        FilterExpression=Attr("gsi_pk").not_exists(),
+        ProjectionExpression="campaign_id",
+    )
     for c in items:
-        if c.get("customer_id") == customer_id and c.get("campaign_id"):
-            campaigns_table.delete_item(Key={"campaign_id": c["campaign_id"]})
+        campaigns_table.update_item(
+            Key={"campaign_id": c["campaign_id"]},
+            UpdateExpression="SET gsi_pk = :pk",
+            ExpressionAttributeValues={":pk": CAMPAIGNS_ALL_PK},
+        )
+    invalidate_list(_campaigns_cache, "campaigns")
+    return len(items)
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+@app.cli.command("backfill-campaigns-index")
+def backfill_campaigns_index():
+    """Add gsi_pk to existing campaigns (run once after creating AllIndex)."""
+    print(f"Backfilled {db_backfill_campaigns_gsi_pk()} campaign(s).")
 
 
 # -----------------------------
@@ -167,7 +385,7 @@ def signup():
             flash("Username already exists!")
             return redirect(url_for("signup"))
 
-        password_hash = generate_password_hash(password, method="pbkdf2:sha256")
+        password_hash = generate_password_hash(password, method=f"pbkdf2:sha256:{PBKDF2_ITER}")
         db_create_user(username, password_hash)
 
         send_notification("New User Signup", f"User {username} signed up.")
@@ -233,11 +451,10 @@ def customers_page():
             flash("Customer ID is required.")
             return redirect(url_for("customers_page"))
 
-        if db_customer_exists(customer_id):
+        if not db_add_customer(customer_id, name, interest):
             flash("Customer already exists.")
             return redirect(url_for("customers_page"))
 
-        db_add_customer(customer_id, name, interest)
         send_notification("Customer Added", f"Customer {customer_id} added.")
         flash("Customer added successfully!")
         return redirect(url_for("customers_page"))
@@ -258,8 +475,7 @@ def delete_customer(customer_id):
     if not require_login():
         return redirect(url_for("login"))
 
-    if db_customer_exists(customer_id):
-        db_delete_customer(customer_id)
+    if db_delete_customer(customer_id):
         db_delete_campaigns_for_customer(customer_id)
         send_notification("Customer Deleted", f"Customer {customer_id} deleted (campaigns removed).")
         flash(f"Deleted customer {customer_id} and related campaigns.")
@@ -281,10 +497,6 @@ def launch_campaign():
         flash("Please select a customer.")
         return redirect(url_for("dashboard"))
 
-    if not db_customer_exists(customer_id):
-        flash("Customer not found. Add customer first.")
-        return redirect(url_for("customers_page"))
-
     if not product:
         flash("Please select a product.")
         return redirect(url_for("dashboard"))
@@ -314,7 +526,10 @@ def launch_campaign():
         "conversions": conversions
     }
 
-    db_add_campaign(campaign_item)
+    # customer existence is checked inside the same write
+    if not db_add_campaign(campaign_item):
+        flash("Customer not found. Add customer first.")
+        return redirect(url_for("customers_page"))
 
     send_notification("Campaign Launched", f"Campaign launched for {customer_id}: {product}")
     flash(f"Campaign launched for {customer_id}")
@@ -344,29 +559,21 @@ def analytics():
         return redirect(url_for("login"))
 
     customers = db_list_customers()
-    all_campaigns = db_list_campaigns()
 
     customer_filter = request.args.get("customer", "").strip()
     q = request.args.get("q", "").strip().lower()
 
-    filtered = all_campaigns
-
-    if customer_filter:
-        filtered = [c for c in filtered if c.get("customer_id") == customer_filter]
+    # customer filter is answered by the CustomerIndex GSI
+    filtered = db_list_campaigns(customer_filter)
 
+    # search across customer_id/product/status/created_at
     if q:
-        def match(c):
-            return (
-                q in str(c.get("customer_id", "")).lower()
-                or q in str(c.get("product", "")).lower()
-                or q in str(c.get("status", "")).lower()
-                or q in str(c.get("created_at", "")).lower()
-            )
-        filtered = [c for c in filtered if match(c)]
+        filtered = [c for c in filtered if q in c["_search"]]
 
     total, sent, avg_open, avg_click, total_conv = compute_stats(filtered)
 
-    return render_template(
+    # stream the page so the rendered HTML is never held in memory as a whole
+    return app.response_class(stream_template(
         "analytics.html",
         username=session["username"],
         customers=customers,
@@ -378,7 +585,7 @@ def analytics():
         total_conversions=total_conv,
         customer_filter=customer_filter,
         q=q
-    )
+    ), mimetype="text/html")
 
 
 if __name__ == "__main__":
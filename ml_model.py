@@ -1,71 +1,117 @@
+import copy
 import os
 import pickle
-from sklearn.feature_extraction import DictVectorizer
-from sklearn.linear_model import LogisticRegression
+import tempfile
+import numpy as np
+from sklearn.linear_model import SGDClassifier
 
 MODEL_PATH = "recommender.pkl"
 
 PRODUCTS = ["Wireless Headphones", "Smartwatch", "Laptop", "Bluetooth Speaker"]
 
+# Fixed feature layout:
+#   columns 0-2 -> open_rate/100, click_rate/100, conversions/10 (all ~0-1,
+#                  the same range as the one-hot columns, so SGD converges)
+#   columns 3+  -> one-hot interest (anything not listed counts as "unknown")
+# Bump FEATURE_LAYOUT whenever this changes; saved models with another
+# layout are ignored.
+FEATURE_LAYOUT = 2
+_INTEREST_VOCAB = ["electronics", "gadgets", "computers", "music", "unknown"]
+_INTEREST_COL = {interest: 3 + i for i, interest in enumerate(_INTEREST_VOCAB)}
+N_FEATURES = 3 + len(_INTEREST_VOCAB)
+
+# clf kept in memory; reloaded only when the pickle's mtime changes
+_MODEL_CACHE = {"mtime": None, "model": None}
+
+
+def fill_features(X, i, interest, campaign):
+    """Write one sample (interest + engagement of campaign) into row i of X."""
+    X[i, 0] = campaign.get("open_rate", 0) / 100
+    X[i, 1] = campaign.get("click_rate", 0) / 100
+    X[i, 2] = campaign.get("conversions", 0) / 10
+    X[i, _INTEREST_COL.get(str(interest).lower(), _INTEREST_COL["unknown"])] = 1.0
+
+
 def build_training_data(customers, campaigns):
     """
     Build X (features) and y (product) from your stored customers + campaign results.
     Uses customer interest + engagement features.
     """
-    X = []
+    rows = [c for c in campaigns if c["product"] in PRODUCTS]
+
+    X = np.zeros((len(rows), N_FEATURES), dtype=np.float32)
     y = []
 
     # Only learn from campaigns that have engagement outcome
-    for c in campaigns:
-        cust_id = c["customer_id"]
-        cust = customers.get(cust_id, {})
+    for i, c in enumerate(rows):
+        cust = customers.get(c["customer_id"], {})
 
         # Interest feature (important!)
-        interest = cust.get("interest", "unknown")
-
-        # Engagement features
-        open_rate = c.get("open_rate", 0)
-        click_rate = c.get("click_rate", 0)
-        conversions = c.get("conversions", 0)
-
-        features = {
-            "interest": interest,
-            "open_rate": open_rate,
-            "click_rate": click_rate,
-            "conversions": conversions,
-        }
-
-        X.append(features)
+        fill_features(X, i, cust.get("interest", "unknown"), c)
         y.append(c["product"])
 
     return X, y
 
 
-def train_and_save(customers, campaigns):
-    X, y = build_training_data(customers, campaigns)
+def train_and_save(customers, campaigns, new_campaigns=None):
+    """
+    Train incrementally: partial_fit the saved model on new_campaigns only.
+    With no saved model (or no new_campaigns given) bootstrap from all campaigns.
+    """
+    model = load_model()
+    if new_campaigns is not None and model is not None:
+        X, y = build_training_data(customers, new_campaigns)
+        if not y:
+            return None
+        # copy so recommend() never sees a half-updated model
+        clf = copy.deepcopy(model)
+        clf.partial_fit(X, y)
+    else:
+        X, y = build_training_data(customers, campaigns)
 
-    # If not enough data, don't train
-    if len(X) < 5:
-        return None
+        # If not enough data, don't train
+        if len(X) < 5:
+            return None
 
-    vec = DictVectorizer(sparse=False)
-    X_vec = vec.fit_transform(X)
+        clf = SGDClassifier(loss="log_loss")
+        clf.feature_layout = FEATURE_LAYOUT
+        clf.partial_fit(X, y, classes=PRODUCTS)
 
-    clf = LogisticRegression(max_iter=500)
-    clf.fit(X_vec, y)
+    # write a temp file and swap it in, so readers never see a partial pickle
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(MODEL_PATH)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(clf, f)
+        os.replace(tmp_path, MODEL_PATH)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
 
-    with open(MODEL_PATH, "wb") as f:
-        pickle.dump((vec, clf), f)
+    # record the new file's mtime so this process doesn't unpickle what it
+    # just wrote; other processes reload it once via the mtime check
+    _MODEL_CACHE.update(mtime=os.stat(MODEL_PATH).st_mtime, model=clf)
 
-    return (vec, clf)
+    return clf
 
 
 def load_model():
-    if not os.path.exists(MODEL_PATH):
+    try:
+        mtime = os.stat(MODEL_PATH).st_mtime
+    except FileNotFoundError:
         return None
-    with open(MODEL_PATH, "rb") as f:
-        vec, clf = pickle.load(f)
-    return vec, clf
+    if mtime == _MODEL_CACHE["mtime"]:
+        return _MODEL_CACHE["model"]
+    try:
+        with open(MODEL_PATH, "rb") as f:
+            clf = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        # unreadable file: keep serving the last good model
+        return _MODEL_CACHE["model"]
+    # older pickles were (vectorizer, model) pairs or used another feature layout
+    if getattr(clf, "feature_layout", None) != FEATURE_LAYOUT:
+        clf = None
+    _MODEL_CACHE.update(mtime=mtime, model=clf)
+    return clf
 
 
 def recommend(customers, campaigns, customer_id):
@@ -73,12 +119,12 @@ def recommend(customers, campaigns, customer_id):
     Recommend best product for customer_id using trained model.
     If no model available, fallback to smart rule-based default.
     """
-    model = load_model()
+    clf = load_model()
     cust = customers.get(customer_id, {})
     interest = cust.get("interest", "unknown")
 
     # fallback if no model trained yet
-    if model is None:
+    if clf is None:
         # Smart fallback (not random)
         mapping = {
             "electronics": "Wireless Headphones",
@@ -88,25 +134,11 @@ def recommend(customers, campaigns, customer_id):
         }
         return mapping.get(interest.lower(), "Wireless Headphones")
 
-    vec, clf = model
-
     # Build feature from customer's recent engagement
     recent = [c for c in campaigns if c["customer_id"] == customer_id]
-    if recent:
-        last = recent[-1]
-        open_rate = last.get("open_rate", 0)
-        click_rate = last.get("click_rate", 0)
-        conversions = last.get("conversions", 0)
-    else:
-        open_rate = click_rate = conversions = 0
-
-    features = [{
-        "interest": interest,
-        "open_rate": open_rate,
-        "click_rate": click_rate,
-        "conversions": conversions,
-    }]
+    last = recent[-1] if recent else {}
 
-    X_vec = vec.transform(features)
-    pred = clf.predict(X_vec)[0]
+    X = np.zeros((1, N_FEATURES), dtype=np.float32)
+    fill_features(X, 0, interest, last)
+    pred = clf.predict(X)[0]
     return pred
@@ -17,6 +17,9 @@ os.environ["USERS_TABLE"] = "MarketingUsers"
 os.environ["CUSTOMERS_TABLE"] = "MarketingCustomers"
 os.environ["CAMPAIGNS_TABLE"] = "MarketingCampaigns"
 
+# Cheap password hashing for local testing (production keeps the default)
+os.environ["PBKDF2_ITERATIONS"] = "1000"
+
 # Start Moto mock BEFORE importing app_aws
 mock = mock_aws()
 mock.start()
@@ -52,10 +55,36 @@ def setup_infrastructure():
     )
 
     # Table: MarketingCampaigns (PK: campaign_id)
+    # GSIs: CustomerIndex (customer_id, created_at), AllIndex (gsi_pk="ALL", created_at)
     dynamodb.create_table(
         TableName="MarketingCampaigns",
         KeySchema=[{"AttributeName": "campaign_id", "KeyType": "HASH"}],
-        AttributeDefinitions=[{"AttributeName": "campaign_id", "AttributeType": "S"}],
+        AttributeDefinitions=[
+            {"AttributeName": "campaign_id", "AttributeType": "S"},
+            {"AttributeName": "customer_id", "AttributeType": "S"},
+            {"AttributeName": "gsi_pk", "AttributeType": "S"},
+            {"AttributeName": "created_at", "AttributeType": "S"},
+        ],
+        GlobalSecondaryIndexes=[
+            {
+                "IndexName": "CustomerIndex",
+                "KeySchema": [
+                    {"AttributeName": "customer_id", "KeyType": "HASH"},
+                    {"AttributeName": "created_at", "KeyType": "RANGE"},
+                ],
+                "Projection": {"ProjectionType": "ALL"},
+                "ProvisionedThroughput": {"ReadCapacityUnits": 5, "WriteCapacityUnits": 5},
+            },
+            {
+                "IndexName": "AllIndex",
+                "KeySchema": [
+                    {"AttributeName": "gsi_pk", "KeyType": "HASH"},
+                    {"AttributeName": "created_at", "KeyType": "RANGE"},
+                ],
+                "Projection": {"ProjectionType": "ALL"},
+                "ProvisionedThroughput": {"ReadCapacityUnits": 5, "WriteCapacityUnits": 5},
+            },
+        ],
         ProvisionedThroughput={"ReadCapacityUnits": 5, "WriteCapacityUnits": 5},
     )
 